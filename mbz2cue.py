@@ -1,44 +1,262 @@
-import requests
-from bs4 import BeautifulSoup
 import argparse
+from functools import lru_cache
+from pathlib import Path
+import re
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from itertools import accumulate
+
+# requests, requests_cache, lxml and orjson are imported where they are first
+# needed, so --help and argument errors only pay for the standard library.
 
 DEBUG_LEVEL = 0  # 0: No debug, 1: Errors, 2: Info, 3: Debug
 
-def debug_print(level, message):
-    """Prints a debug message """
+_SESSION = None
+_session_lock = threading.Lock()
+
+MIN_REQUEST_INTERVAL = 1.0  # MusicBrainz allows one request per second
+RETRY_STATUSES = (429, 502, 503)  # MusicBrainz throttling / overload responses
+MAX_RETRIES = 3
+_rate_lock = threading.Lock()
+_next_request_time = 0.0
+
+MBID_RE = re.compile(r'/release/([0-9a-f-]{36})')
+WS_RELEASE_URL = "https://musicbrainz.org/ws/2/release/{mbid}?inc=recordings+artist-credits&fmt=json"
+
+def debug_print(level, message, *args):
+    """Prints a debug message, %-formatting it with args only if it is shown."""
     global DEBUG_LEVEL  
     if DEBUG_LEVEL >= level:
-        print(message)
+        print(message % args if args else message)
+
+def wait_for_rate_limit():
+    """Blocks until another request may be sent to MusicBrainz."""
+    global _next_request_time
+    with _rate_lock:
+        now = time.monotonic()
+        delay = _next_request_time - now
+        _next_request_time = max(now, _next_request_time) + MIN_REQUEST_INTERVAL
+    if delay > 0:
+        time.sleep(delay)
+
+def get_session():
+    """Returns the shared HTTP session, creating it on first use.
+
+    Keep-alive connections (and their TLS setup) are reused across requests, and
+    MusicBrainz throttling responses are retried on the same pool. Responses are
+    cached on disk for a day so re-runs against the same release skip the
+    download (and revalidate with ETag/Last-Modified once stale).
+    """
+    global _SESSION
+    with _session_lock:
+        if _SESSION is None:
+            import requests_cache
+            from requests.adapters import HTTPAdapter
+            from urllib3.util.retry import Retry
+
+            class RateLimitedAdapter(HTTPAdapter):
+                """HTTPAdapter applying the MusicBrainz rate limit to each request it sends.
+
+                CachedSession only reaches the adapter on a cache miss or revalidation,
+                so responses served from the disk cache are not throttled. Throttling
+                responses are retried here rather than by urllib3, so every attempt
+                goes through the rate limiter.
+                """
+
+                def send(self, request, **kwargs):
+                    for attempt in range(MAX_RETRIES + 1):
+                        wait_for_rate_limit()
+                        response = super().send(request, **kwargs)
+                        if response.status_code not in RETRY_STATUSES or attempt == MAX_RETRIES:
+                            return response
+
+                        retry_after = response.headers.get('Retry-After', '')
+                        debug_print(2, "Got %s from %s, retrying.", response.status_code, request.url)
+                        response.close()
+                        if retry_after.isdigit():
+                            time.sleep(int(retry_after))
+
+            session = requests_cache.CachedSession('mbz2cue-cache', backend='sqlite', expire_after=86400, cache_control=True)
+            session.headers.update({'User-Agent': 'mbz2cue/1.0'})
+            # urllib3 only retries failed connections, which never reach the server.
+            adapter = RateLimitedAdapter(
+                pool_connections=4,
+                pool_maxsize=4,
+                max_retries=Retry(total=MAX_RETRIES, connect=MAX_RETRIES, read=0, status=0, other=0, backoff_factor=0.3),
+            )
+            session.mount('https://', adapter)
+            session.mount('http://', adapter)
+            _SESSION = session
+    return _SESSION
+
+@lru_cache(maxsize=None)
+def scrape_xpaths():
+    """Compiles the XPath expressions used to scrape the HTML release page.
+
+    Compiled once so the per-row extraction runs entirely in libxml2.
+
+    Returns:
+        tuple: The album title, disc table, track row, track number, title, artist and length expressions.
+    """
+    from lxml import etree
+
+    return (
+        etree.XPath("normalize-space((//h1//bdi)[1])"),
+        etree.XPath("//table[contains(concat(' ', @class, ' '), ' tbl ') and contains(concat(' ', @class, ' '), ' medium ')]"),
+        etree.XPath(".//tr[contains(concat(' ', @class, ' '), ' odd ') or contains(concat(' ', @class, ' '), ' even ')][count(td) >= 5]"),
+        etree.XPath("normalize-space(td[1])"),
+        # The cell's first <bdi> if it has one, otherwise the cell itself.
+        etree.XPath("normalize-space(td[2][not(.//bdi)] | (td[2]//bdi)[1])"),
+        etree.XPath("normalize-space(td[3][not(.//bdi)] | (td[3]//bdi)[1])"),
+        etree.XPath("normalize-space(td[5])"),
+    )
+
+def fetch_page(url):
+    """Fetches a URL through the shared session.
+
+    Args:
+        url (str): The URL to fetch.
+
+    Returns:
+        requests.Response: The response, or None if the request failed.
+    """
+    import requests
+
+    session = get_session()
+    try:
+        response = session.get(url, timeout=10)
+    except requests.RequestException as e:
+        debug_print(1, "Failed to fetch page: %s", e)
+        return None
+
+    if response.status_code != 200:
+        debug_print(1, "Failed to fetch page: %s", response.status_code)
+        return None
+
+    return response
+
+def format_length(length_ms):
+    """Formats a track length in milliseconds as MM:SS."""
+    minutes, seconds = divmod(round(length_ms / 1000), 60)
+    return f"{minutes:02}:{seconds:02}"
 
 def extract_tracklist(url):
     """Extracts the tracklist from a MusicBrainz release URL.
 
+    Uses the MusicBrainz JSON web service when the URL contains a release MBID,
+    and falls back to scraping the HTML page otherwise.
+
     Args:
         url (str): The MusicBrainz release URL.
 
     Returns:
         tuple: A tuple containing the tracklist (list of dictionaries) and the album title (str), or (None, None) if an error occurs.
     """
-    headers = {'User-Agent': 'Mozilla/5.0'}
-    response = requests.get(url, headers=headers)
+    match = MBID_RE.search(url)
+    if match:
+        return fetch_release_tracklist(match.group(1))
 
-    if response.status_code != 200:
-        debug_print(1, f"Failed to fetch page: {response.status_code}")
+    debug_print(2, "No release MBID found in URL, scraping the HTML page.")
+    return scrape_tracklist(url)
+
+def fetch_release_tracklist(mbid):
+    """Extracts the tracklist of a release from the MusicBrainz JSON web service.
+
+    Args:
+        mbid (str): The MusicBrainz release ID.
+
+    Returns:
+        tuple: A tuple containing the tracklist (list of dictionaries) and the album title (str), or (None, None) if an error occurs.
+    """
+    response = fetch_page(WS_RELEASE_URL.format(mbid=mbid))
+    if response is None:
+        return None, None
+
+    import orjson
+
+    data = orjson.loads(response.content)
+
+    album_title = data.get('title') or "Unknown Album"
+    debug_print(2, "Extracted album title: %s", album_title)
+
+    media = data.get('media')
+    if not media:
+        debug_print(1, "No media found!")
+        return None, album_title
+
+    dbg = DEBUG_LEVEL
+    tracklists = []
+    for disc_num, medium in enumerate(media, start=1):
+        if not medium.get('tracks'):
+            # Media with an unknown tracklist have no tracks to put in a CUE sheet.
+            debug_print(1, "No tracks listed for disc %d, skipping it.", disc_num)
+            continue
+
+        tracklist = []
+
+        for track in medium['tracks']:
+            track_number = str(track['position'])
+            title = track['title']
+            artist = ''.join(credit['name'] + credit.get('joinphrase', '') for credit in track['artist-credit'])
+            if track.get('length') is None:
+                # Index times are derived from lengths; guessing would shift every later track.
+                raise ValueError(f"Length unknown for track {track_number} of disc {disc_num}, cannot compute CUE index times.")
+            length = format_length(track['length'])
+
+            tracklist.append({
+                'track_number': track_number,
+                'title': title,
+                'artist': artist,
+                'length': length,
+                'disc_number': disc_num
+            })
+            if dbg >= 3:
+                debug_print(3, "Extracted track: %s - %s - %s - %s", track_number, title, artist, length)
+
+        debug_print(2, "Extracted %d tracks for disc %d.", len(tracklist), disc_num)
+        tracklists.append(tracklist)
+
+    if not tracklists:
+        debug_print(1, "No tracks found!")
+        return None, album_title
+
+    return tracklists, album_title
+
+def scrape_tracklist(url):
+    """Extracts the tracklist by scraping a MusicBrainz release HTML page.
+
+    Args:
+        url (str): The MusicBrainz release URL.
+
+    Returns:
+        tuple: A tuple containing the tracklist (list of dictionaries) and the album title (str), or (None, None) if an error occurs.
+    """
+    from lxml import etree
+
+    album_title_xp, disc_table_xp, track_row_xp, track_number_xp, title_xp, artist_xp, length_xp = scrape_xpaths()
+
+    response = fetch_page(url)
+    if response is None:
+        return None, None
+
+    # Parse the raw bytes so libxml2 detects the charset itself.
+    tree = etree.fromstring(response.content, etree.HTMLParser())
+    if tree is None:
+        debug_print(1, "Failed to parse page: empty document")
         return None, None
 
-    soup = BeautifulSoup(response.text, 'html.parser')
-    
-    title_tag = soup.find('h1')
-    if title_tag and title_tag.find('bdi'):
-        album_title = title_tag.find('bdi').get_text(strip=True)
-        debug_print(2, f"Extracted album title: {album_title}")
+    album_title = album_title_xp(tree)
+    if album_title:
+        debug_print(2, "Extracted album title: %s", album_title)
     else:
         debug_print(1, "Album title not found.")
         album_title= "Unknown Album"
 
+    dbg = DEBUG_LEVEL
     tracklists = []
-    # disc_divs = soup.find_all('div', class_='tracklist-and-credits') 
-    disc_tables = soup.find_all('table', class_='tbl medium') 
+    disc_tables = disc_table_xp(tree)
 
     if not disc_tables:
         debug_print(1, "No tracklist divs found!")
@@ -46,26 +264,23 @@ def extract_tracklist(url):
 
     for disc_num, tracklist_div in enumerate(disc_tables, start=1):  
         tracklist = []
-        table_rows = tracklist_div.find_all('tr', class_=['odd', 'even'])
-
-        for row in table_rows:
-            columns = row.find_all('td')
-            if len(columns) >= 5:
-                track_number = columns[0].get_text(strip=True)
-                title = columns[1].find('bdi').get_text(strip=True) if columns[1].find('bdi') else columns[1].get_text(strip=True)
-                artist = columns[2].find('bdi').get_text(strip=True) if columns[2].find('bdi') else columns[2].get_text(strip=True)
-                length = columns[4].get_text(strip=True)
-
-                tracklist.append({
-                    'track_number': track_number,
-                    'title': title,
-                    'artist': artist,
-                    'length': length,
-                    'disc_number': disc_num  
-                })
-                debug_print(3, f"Extracted track: {track_number} - {title} - {artist} - {length}")
-
-        debug_print(2, f"Extracted {len(tracklist)} tracks for disc {disc_num}.")
+        for row in track_row_xp(tracklist_div):
+            track_number = track_number_xp(row)
+            title = title_xp(row)
+            artist = artist_xp(row)
+            length = length_xp(row)
+
+            tracklist.append({
+                'track_number': track_number,
+                'title': title,
+                'artist': artist,
+                'length': length,
+                'disc_number': disc_num  
+            })
+            if dbg >= 3:
+                debug_print(3, "Extracted track: %s - %s - %s - %s", track_number, title, artist, length)
+
+        debug_print(2, "Extracted %d tracks for disc %d.", len(tracklist), disc_num)
         tracklists.append(tracklist) 
 
     return tracklists, album_title
@@ -83,49 +298,87 @@ def create_cue_sheet(tracklist, album_title, performer, filename, wav_filename):
     for disc_tracklist in tracklist:  
         disc_number = disc_tracklist[0]['disc_number'] 
         filename_disc = filename.replace(".cue", f"_disc{disc_number}.cue") 
-        wav_filename = f"{wav_filename}" 
-        with open(filename_disc, 'w', encoding='utf-8') as f:
-            f.write(f'PERFORMER "{performer}"\n')
-            f.write(f'TITLE "{album_title} (Disc {disc_number})"\n') 
-            f.write(f'FILE "{wav_filename}" WAVE\n')
+        parts = [
+            f'PERFORMER "{performer}"\n',
+            f'TITLE "{album_title} (Disc {disc_number})"\n',
+            f'FILE "{wav_filename}" WAVE\n',
+        ]
 
-            total_seconds = 0
-            for track in disc_tracklist:
-                minutes, seconds = map(int, track['length'].split(':'))
-                track_start_minutes = total_seconds // 60
-                track_start_seconds = total_seconds % 60
-                index_time = f"{track_start_minutes:02}:{track_start_seconds:02}:00"
+        lengths = [int(minutes) * 60 + int(seconds) for minutes, _, seconds in (track['length'].partition(':') for track in disc_tracklist)]
+        # Each track starts where the previous ones end: a prefix sum of the lengths.
+        track_starts = accumulate(lengths[:-1], initial=0)
 
-                f.write(f'\nTRACK {int(track["track_number"]):02} AUDIO\n')
-                f.write(f'    TITLE "{track["title"]}"\n')
-                f.write(f'    PERFORMER "{track["artist"]}"\n')
-                f.write(f'    INDEX 01 {index_time}\n')
+        for track, track_start in zip(disc_tracklist, track_starts):
+            track_start_minutes, track_start_seconds = divmod(track_start, 60)
 
-                total_seconds += minutes * 60 + seconds
+            parts.append(
+                f'\nTRACK {int(track["track_number"]):02} AUDIO\n'
+                f'    TITLE "{track["title"]}"\n'
+                f'    PERFORMER "{track["artist"]}"\n'
+                f'    INDEX 01 {track_start_minutes:02}:{track_start_seconds:02}:00\n'
+            )
 
-        debug_print(1, f"CUE sheet written to {filename_disc}.")
+        # One write per disc instead of four per track.
+        Path(filename_disc).write_text(''.join(parts), encoding='utf-8')
+
+        debug_print(1, "CUE sheet written to %s.", filename_disc)
 
 def main():
-    """Parses command-line arguments and generates a CUE sheet."""
+    """Parses command-line arguments and generates a CUE sheet for each release."""
     global DEBUG_LEVEL
     parser = argparse.ArgumentParser(description="Extract tracklist from MusicBrainz and generate a CUE sheet.")
-    parser.add_argument("--url", required=True, help="MusicBrainz release URL")
-    parser.add_argument("--output_file", help="Output CUE file name (e.g., album.cue will create album_disc1.cue, album_disc2.cue, etc.)")
+    parser.add_argument("--url", required=True, nargs='+', help="MusicBrainz release URL(s)")
+    parser.add_argument("--output_file", help="Output CUE file name (e.g., album.cue will create album_disc1.cue, album_disc2.cue, etc.); only valid with a single URL")
     parser.add_argument("--wav_filename", required=True, help="WAV file name")
     parser.add_argument("--debug_level", type=int, default=0, help="Debug level (0-2)")
     args = parser.parse_args()
 
+    if args.output_file and len(args.url) > 1:
+        parser.error("--output_file can only be used with a single --url")
+
     DEBUG_LEVEL = args.debug_level
 
-    tracklists, album_title = extract_tracklist(args.url)
+    # Fetches are network-bound, so overlap them; the rate limiter keeps us
+    # within MusicBrainz's request policy.
+    used_output_files = set()
+    failed = False
+    with ThreadPoolExecutor(max_workers=4) as executor:
+        futures = [executor.submit(extract_tracklist, url) for url in args.url]
+        # Results are handled in --url order so output names do not depend on
+        # which download finishes first.
+        for index, (url, future) in enumerate(zip(args.url, futures), start=1):
+            # A bad release must not stop the CUE sheets of the others.
+            try:
+                tracklists, album_title = future.result()
 
-    if tracklists:
-        output_file = args.output_file if args.output_file else f"{album_title}.cue"
-        output_file = output_file.replace("/", "_")
+                if not tracklists:
+                    print(f"No tracklist extracted from {url} (use --debug_level 1 for details).", file=sys.stderr)
+                    failed = True
+                else:
+                    output_file = args.output_file if args.output_file else f"{album_title}.cue"
+                    output_file = output_file.replace("/", "_")
+                    if output_file in used_output_files:
+                        # Editions of the same album share its title; keep their sheets apart.
+                        match = MBID_RE.search(url)
+                        suffix = match.group(1) if match else str(index)
+                        output_file = f"{album_title} ({suffix}).cue".replace("/", "_")
+                        if output_file in used_output_files:
+                            # The same release was passed twice.
+                            output_file = f"{album_title} ({suffix}, {index}).cue".replace("/", "_")
+                        debug_print(1, "CUE sheets for %s would overwrite another release's, naming them %s instead.", url, output_file)
+                    used_output_files.add(output_file)
 
-        create_cue_sheet(tracklists, album_title=album_title, performer="Various Artists", filename=output_file, wav_filename=args.wav_filename)
-        debug_print(1, "CUE sheets created successfully.")
+                    create_cue_sheet(tracklists, album_title=album_title, performer="Various Artists", filename=output_file, wav_filename=args.wav_filename)
+                    debug_print(1, "CUE sheets created successfully.")
+            # Bad data (e.g. a non-numeric track number) or an unwritable file;
+            # orjson.JSONDecodeError is a ValueError. Anything else is a bug and
+            # propagates.
+            except (ValueError, KeyError, OSError) as e:
+                print(f"Failed to create CUE sheets for {url}: {e}", file=sys.stderr)
+                failed = True
 
+    if failed:
+        sys.exit(1)
 
 if __name__ == "__main__":
     main()
\ No newline at end of file